@@ -0,0 +1,426 @@
+from datetime import datetime, timedelta
+import gradio as gr
+from huggingface_hub import AsyncInferenceClient, InferenceTimeoutError
+from huggingface_hub.utils import HfHubHTTPError
+import os
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from zoneinfo import ZoneInfo
+from llm_cache import LLMCache
+
+# --- Конфигурация ---
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+CALENDAR_ID = os.environ.get('GOOGLE_CALENDAR_ID')
+CALENDAR_TIMEZONE = 'Europe/Moscow'
+# JSON сервисного аккаунта разбирается один раз при запуске
+_CREDS_INFO = json.loads(os.environ['GOOGLE_CREDS']) if os.environ.get('GOOGLE_CREDS') else None
+WEBHOOK_URL = os.environ.get('CONFIRMATION_WEBHOOK_URL')
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 2
+# Таймауты инференса (сек): на установку соединения и начало ответа
+# и на ожидание очередного токена
+INFERENCE_TIMEOUT = 30
+TOKEN_TIMEOUT = 10
+# Сколько диалогов Gradio обслуживает одновременно (по умолчанию только один)
+CHAT_CONCURRENCY_LIMIT = 16
+
+# Ключевые слова сценария записи: один проход по сообщению без копии в нижнем регистре
+_INTENT_RE = re.compile(r"симптом|запись", re.IGNORECASE)
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# --- Инициализация сервисов ---
+# Стек Google API, httpx и классификатор симптомов импортируются при первом
+# использовании: обычный диалог с моделью не должен ждать их загрузки
+_SERVICE = None
+_CREDS = None
+_SERVICE_LOCK = threading.Lock()
+_HTTP_LOCAL = threading.local()
+
+def _refresh_service_if_stale():
+    """Получение токена сервисного аккаунта, если его еще нет или срок истек"""
+    if _CREDS is not None and not _CREDS.valid:
+        from google_auth_httplib2 import Request
+        from googleapiclient.http import build_http
+        _CREDS.refresh(Request(build_http()))
+
+def _build_request(http, *args, **kwargs):
+    """Запрос через постоянное соединение текущего потока (httplib2.Http не потокобезопасен)"""
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import HttpRequest, build_http
+    if not hasattr(_HTTP_LOCAL, 'http'):
+        # build_http задает таймаут сокета (60 с) и настройки редиректов, как в build()
+        _HTTP_LOCAL.http = AuthorizedHttp(_CREDS, http=build_http())
+    return HttpRequest(_HTTP_LOCAL.http, *args, **kwargs)
+
+def get_calendar_service():
+    """Единый клиент Calendar API: учетные данные и discovery-документ разбираются один раз"""
+    global _SERVICE, _CREDS
+    with _SERVICE_LOCK:
+        if _SERVICE is None:
+            if _CREDS_INFO is None:
+                raise RuntimeError("GOOGLE_CREDS не задан")
+            from google.oauth2 import service_account
+            from googleapiclient.discovery import build
+            _CREDS = service_account.Credentials.from_service_account_info(
+                _CREDS_INFO,
+                scopes=SCOPES
+            )
+            _SERVICE = build(
+                'calendar', 'v3',
+                credentials=_CREDS,
+                cache_discovery=False,
+                static_discovery=True,
+                requestBuilder=_build_request
+            )
+        service = _SERVICE
+    # Токен обновляется вне блокировки: медленный ответ сервера токенов
+    # не должен задерживать остальные вызовы get_calendar_service()
+    _refresh_service_if_stale()
+    return service
+
+def load_system_prompt():
+    try:
+        return Path("prompt-doctor.txt").read_text(encoding="utf-8").strip()
+    except Exception as e:
+        logger.error(f"Error loading prompt: {e}")
+        return """Вы — система записи к врачу. Строго следуйте инструкциям из prompt-doctor.txt"""
+
+SYSTEM_PROMPT = load_system_prompt()
+# Системное сообщение собирается один раз и переиспользуется в каждом запросе
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+# timeout клиента не задается: в версиях на aiohttp он ограничивает весь стрим
+# целиком (ClientTimeout(total=...)) и обрывал бы длинные ответы
+client = AsyncInferenceClient(token=os.environ.get("HF_TOKEN"))
+# temperature=0.3 дает достаточно стабильные ответы, чтобы их переиспользовать
+response_cache = LLMCache(is_deterministic=True)
+response_cache.start_warmup()
+_WEBHOOK_CLIENT = None
+
+# --- Вспомогательные функции ---
+def format_prompt(message: str, history: list) -> list:
+    # Статичный системный промпт всегда идет первым отдельным сообщением —
+    # так бэкенд инференса может переиспользовать кэш префикса между запросами
+    # История приходит из ChatInterface(type="messages") уже в формате чата
+    turns = [{"role": turn["role"], "content": turn["content"]} for turn in history]
+    return [SYSTEM_MESSAGE, *turns, {"role": "user", "content": message}]
+
+def _get_webhook_client():
+    global _WEBHOOK_CLIENT
+    if _WEBHOOK_CLIENT is None:
+        import httpx
+        _WEBHOOK_CLIENT = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=16)
+        )
+    return _WEBHOOK_CLIENT
+
+async def send_webhook_confirmation(event_id: str):
+    """Отправка вебхука для подтверждения записи (с повторами и экспоненциальной задержкой)"""
+    if not WEBHOOK_URL:
+        logger.warning("WEBHOOK_URL не настроен, пропускаем подтверждение")
+        return
+
+    import httpx
+    webhook_client = _get_webhook_client()
+
+    payload = {
+        "event_id": event_id,
+        "status": "pending_confirmation"
+    }
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = await webhook_client.post(
+                WEBHOOK_URL,
+                json=payload
+            )
+            response.raise_for_status()
+            logger.info(f"Webhook отправлен успешно для события {event_id}")
+            return
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            logger.error(f"Ошибка вебхука (попытка {attempt + 1}/{MAX_RETRIES}): {str(e)}")
+            # Повторяем только сетевые сбои, 5xx и 429; остальные ответы не изменятся
+            status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            if status is not None and status < 500 and status != 429:
+                raise
+            if attempt == MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, 1))
+
+def check_duplicate_event(events_result: dict, created_event: dict) -> bool:
+    """Проверка, есть ли у пациента запись, созданная раньше только что добавленной"""
+    # При одновременных отправках каждая видит событие другой; дубликатом
+    # считается только более позднее (по created, затем по id), поэтому
+    # одна из записей всегда остается в календаре
+    own_order = (created_event.get('created', ''), created_event['id'])
+    return any(
+        (item.get('created', ''), item['id']) < own_order
+        for item in events_result.get('items', [])
+        if item.get('id') != created_event['id']
+    )
+
+def _normalize_symptoms(symptoms: str) -> str:
+    return _WHITESPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", symptoms.lower())).strip()
+
+@lru_cache(maxsize=1024)
+def _cached_specialist(symptoms_norm: str) -> str:
+    from symptom_classifier import define_specialist
+    return define_specialist(symptoms_norm)
+
+def classify_symptoms(symptoms: str) -> str:
+    """Специалист по описанию симптомов; одинаковые формулировки классифицируются один раз"""
+    return _cached_specialist(_normalize_symptoms(symptoms))
+
+# --- Основная логика ---
+def insert_event(event: dict) -> dict:
+    service = get_calendar_service()
+    return service.events().insert(
+        calendarId=CALENDAR_ID,
+        body=event
+    ).execute()
+
+def create_unique_event(event: dict, name: str, time_min: str, time_max: str) -> Optional[dict]:
+    """Создание события в календаре; None, если у пациента уже есть запись"""
+    from googleapiclient.errors import HttpError
+    from httplib2 import HttpLib2Error
+    service = get_calendar_service()
+
+    # Проверка дубликатов и создание события одним batch-запросом
+    responses = {}
+    def collect(request_id, response, exception):
+        responses[request_id] = (response, exception)
+
+    batch = service.new_batch_http_request(callback=collect)
+    batch.add(service.events().list(
+        calendarId=CALENDAR_ID,
+        timeMin=time_min,
+        timeMax=time_max,
+        q=f"Прием: {name}",
+        maxResults=10
+    ), request_id='duplicate')
+    batch.add(service.events().insert(
+        calendarId=CALENDAR_ID,
+        body=event
+    ), request_id='insert')
+    batch.execute()
+
+    created_event, insert_error = responses['insert']
+    if insert_error:
+        raise insert_error
+
+    events_result, list_error = responses['duplicate']
+    if list_error:
+        logger.error(f"Ошибка проверки дубликатов: {str(list_error)}")
+    elif check_duplicate_event(events_result, created_event):
+        # Компенсирующее удаление: запись уже существовала
+        try:
+            service.events().delete(
+                calendarId=CALENDAR_ID,
+                eventId=created_event['id']
+            ).execute()
+        except (HttpError, TimeoutError, OSError, HttpLib2Error) as e:
+            logger.error(f"Не удалось удалить дубликат {created_event['id']}, событие осталось в календаре: {str(e)}")
+        return None
+
+    return created_event
+
+async def schedule_appointment(name: str, symptoms: str, *, with_webhook: bool) -> Optional[str]:
+    """Запись к врачу; with_webhook — проверка дубликатов и подтверждение через вебхук"""
+    import httpx
+    from googleapiclient.errors import HttpError
+    from httplib2 import HttpLib2Error
+    try:
+        # Классификация симптомов не зависит от календаря: параллельно с ней
+        # поднимаем клиент Calendar API и получаем токен доступа
+        specialist, _ = await asyncio.gather(
+            asyncio.to_thread(classify_symptoms, symptoms),
+            asyncio.to_thread(get_calendar_service)
+        )
+        appointment_time = datetime.now() + timedelta(hours=3)
+        appointment_end = appointment_time + timedelta(minutes=30)
+
+        event = {
+            'summary': f'Прием: {name}, {specialist}',
+            'description': f'Симптомы: {symptoms}' if with_webhook else f'Симптомы: {symptoms}. Требует подтверждения.',
+            'start': {'dateTime': appointment_time.isoformat(), 'timeZone': CALENDAR_TIMEZONE},
+            'end': {'dateTime': appointment_end.isoformat(), 'timeZone': CALENDAR_TIMEZONE}
+        }
+
+        # Клиент Google API синхронный — выполняем его в отдельном потоке
+        if not with_webhook:
+            await asyncio.to_thread(insert_event, event)
+            return f"Запись к {specialist} на {appointment_time.strftime('%d.%m.%Y %H:%M')} оформлена."
+
+        event['extendedProperties'] = {'private': {'requiresConfirmation': 'true'}}
+        # Дубликаты ищутся в интервале самого приема; timeMin/timeMax в Calendar API
+        # требуют явного смещения, поэтому то же время привязывается к поясу календаря
+        tz = ZoneInfo(CALENDAR_TIMEZONE)
+        created_event = await asyncio.to_thread(
+            create_unique_event, event, name,
+            appointment_time.replace(tzinfo=tz).isoformat(),
+            appointment_end.replace(tzinfo=tz).isoformat()
+        )
+        if created_event is None:
+            return "У вас уже есть активная запись. Пожалуйста, дождитесь подтверждения."
+
+        # Отправка вебхука для подтверждения
+        await send_webhook_confirmation(created_event['id'])
+
+        return f"Предварительная запись к {specialist} на {appointment_time.strftime('%d.%m.%Y %H:%M')} создана. Ожидайте подтверждения."
+
+    except HttpError as e:
+        logger.error(f"Google API error: {str(e)}")
+        return "Ошибка подключения к системе записи. Попробуйте позже."
+    except (TimeoutError, OSError, HttpLib2Error) as e:
+        logger.error(f"Календарь недоступен: {str(e)}")
+        return "Ошибка подключения к системе записи. Попробуйте позже."
+    except (httpx.TransportError, httpx.HTTPStatusError) as e:
+        logger.error(f"Вебхук не доставлен: {str(e)}")
+        return None
+    except Exception:
+        logger.exception("Общая ошибка")
+        return None
+
+# --- Интерфейс Gradio ---
+# Минимальный интервал (сек) между обновлениями ответа при стриминге
+STREAM_YIELD_INTERVAL = 0.05
+
+# Сессии Gradio, ожидающие имя и симптомы: session_hash -> время запроса данных.
+# Брошенные сценарии удаляются по истечении SESSION_STEP_TTL
+SESSION_STEP_TTL = 15 * 60
+_SESSION_STEPS = {}
+
+def _start_booking(session: str):
+    now = time.monotonic()
+    for stale in [key for key, started in _SESSION_STEPS.items() if now - started > SESSION_STEP_TTL]:
+        del _SESSION_STEPS[stale]
+    _SESSION_STEPS[session] = now
+
+def _take_booking(session: str) -> bool:
+    """Ожидала ли сессия имя и симптомы; шаг сбрасывается в любом случае"""
+    started = _SESSION_STEPS.pop(session, None)
+    return started is not None and time.monotonic() - started <= SESSION_STEP_TTL
+
+async def stream_llm_response(message: str, history: list):
+    # Сюда не доходят сообщения о записи и симптомах: у них есть побочные эффекты
+    cached = await response_cache.get(message, history)
+    if cached is not None:
+        yield cached
+        return
+
+    messages = format_prompt(message, history)
+    stream = await asyncio.wait_for(
+        client.chat_completion(
+            messages,
+            max_tokens=512,
+            temperature=0.3,
+            stream=True
+        ),
+        INFERENCE_TIMEOUT
+    )
+
+    # Токены копятся в списке, а строка собирается только для отправки
+    # в чат — не чаще раза в STREAM_YIELD_INTERVAL
+    chunks = []
+    last_yield = 0.0
+    tokens = stream.__aiter__()
+    while True:
+        # Зависший стрим не должен занимать обработчик: ждем токен не дольше TOKEN_TIMEOUT
+        try:
+            chunk = await asyncio.wait_for(tokens.__anext__(), TOKEN_TIMEOUT)
+        except StopAsyncIteration:
+            break
+        except asyncio.TimeoutError:
+            if hasattr(tokens, "aclose"):
+                await tokens.aclose()
+            raise
+        token = chunk.choices[0].delta.content
+        if not token:
+            continue
+        chunks.append(token)
+        now = time.monotonic()
+        if now - last_yield >= STREAM_YIELD_INTERVAL:
+            last_yield = now
+            yield "".join(chunks)
+
+    full_response = "".join(chunks)
+    yield full_response
+
+    await response_cache.put(message, history, full_response)
+
+def make_chat_handler(enable_webhook: bool):
+    """Обработчик ChatInterface: в варианте с вебхуком имя и симптомы разделяются запятой"""
+    async def generate_response(message: str, history: list, request: gr.Request):
+        try:
+            session = request.session_hash
+
+            # Шаг 1: ответ с именем и симптомами принимается без ключевых слов
+            if _take_booking(session):
+                if enable_webhook:
+                    parts = message.split(',', 1)
+                    if len(parts) < 2:
+                        yield "Неверный формат. Пожалуйста, укажите имя и симптомы через запятую."
+                        return
+                    name, symptoms = parts
+                else:
+                    name, *symptoms = message.split(' ', 1)
+                    symptoms = symptoms[0] if symptoms else ""
+
+                response = await schedule_appointment(
+                    name.strip(), symptoms.strip(), with_webhook=enable_webhook
+                )
+                yield response or "Извините, произошла ошибка обработки запроса."
+                return
+
+            # Шаг 0: ключевые слова запускают сценарий записи
+            if _INTENT_RE.search(message):
+                _start_booking(session)
+                if enable_webhook:
+                    yield "Пожалуйста, укажите ваше полное имя и опишите симптомы (через запятую)."
+                else:
+                    yield "Пожалуйста, укажите ваше полное имя и опишите симптомы."
+                return
+
+            async for partial in stream_llm_response(message, history):
+                yield partial
+
+        except (InferenceTimeoutError, HfHubHTTPError, asyncio.TimeoutError, TimeoutError) as e:
+            logger.error(f"Ошибка генерации: {str(e)}")
+            yield "Произошла внутренняя ошибка. Пожалуйста, повторите запрос."
+        except Exception:
+            logger.exception("Непредвиденная ошибка генерации")
+            yield "Произошла внутренняя ошибка. Пожалуйста, повторите запрос."
+
+    return generate_response
+
+def build_app(handler, description: str, examples: list) -> gr.Blocks:
+    custom_theme = gr.themes.Default(
+        primary_hue="blue",
+        secondary_hue="teal",
+        font=[gr.themes.GoogleFont("Open Sans")]
+    )
+
+    with gr.Blocks(theme=custom_theme) as app:
+        gr.Markdown("# Doctor AI 🤖")
+        gr.Markdown(description)
+
+        gr.ChatInterface(
+            fn=handler,
+            type="messages",
+            examples=examples,
+            concurrency_limit=CHAT_CONCURRENCY_LIMIT
+        )
+
+    return app
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import numpy
+
+logger = logging.getLogger(__name__)
+
+# Диалоги ведутся на русском, поэтому нужна многоязычная модель
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class _Entry(NamedTuple):
+    response: str
+    created: float
+    context: str
+    slot: Optional[int]
+
+
+class LLMCache:
+    """LRU-кэш ответов модели.
+
+    Точные совпадения ищутся по SHA-256 от сообщения и истории диалога,
+    близкие по смыслу — по косинусной близости эмбеддингов сообщения
+    (только среди записей с той же историей). Без sentence-transformers
+    работает только точный поиск. Кодирование сообщений выполняется
+    в отдельном потоке, поэтому get/put — корутины.
+
+    numpy и sentence-transformers (вместе с torch) не импортируются при
+    загрузке модуля: start_warmup() поднимает модель в фоновом потоке,
+    а до ее готовности кэш работает только по точному совпадению.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600, threshold: float = 0.93,
+                 is_deterministic: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.is_deterministic = is_deterministic
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._np = None
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._warmup_thread = None
+        self._embeddings_available = True
+        self._matrix = None
+        self._slot_keys = [None] * maxsize
+        self._free_slots = list(range(maxsize))
+        self._last_embedding = (None, None)
+
+    @staticmethod
+    def _make_key(message: str, history: list):
+        context = hashlib.sha256(repr(history).encode("utf-8")).hexdigest()
+        key = hashlib.sha256(f"{context}\0{message}".encode("utf-8")).hexdigest()
+        return key, context
+
+    def start_warmup(self):
+        """Фоновая загрузка модели эмбеддингов, чтобы первый запрос ее не ждал"""
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(
+                target=self._load_model, name="llm-cache-warmup", daemon=True
+            )
+            self._warmup_thread.start()
+
+    def _load_model(self) -> bool:
+        with self._model_lock:
+            if self._model is None and self._embeddings_available:
+                try:
+                    import numpy
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+                    dim = model.get_sentence_embedding_dimension()
+                    self._matrix = numpy.zeros((self.maxsize, dim), dtype=numpy.float32)
+                    self._np = numpy
+                    self._model = model
+                except ImportError as e:
+                    # Пакеты эмбеддингов необязательны: без них это штатный режим
+                    logger.info(f"sentence-transformers/numpy не установлены, кэш работает по точному совпадению: {e}")
+                    self._embeddings_available = False
+                except Exception as e:
+                    logger.error(f"Эмбеддинги недоступны, остается точный поиск: {e}")
+                    self._embeddings_available = False
+        return self._model is not None
+
+    def _encode(self, message: str) -> Optional["numpy.ndarray"]:
+        # Выполняется в рабочем потоке: загрузка модели и encode блокируют на секунды/миллисекунды
+        if not self._load_model():
+            return None
+        return self._model.encode(message, normalize_embeddings=True).astype(self._np.float32)
+
+    async def _embed(self, message: str) -> Optional["numpy.ndarray"]:
+        if not self._embeddings_available:
+            return None
+        if self._model is None and self._warmup_thread is not None and self._warmup_thread.is_alive():
+            # Модель еще загружается — не ждем ее, обходимся точным поиском
+            return None
+        if self._last_embedding[0] == message:
+            return self._last_embedding[1]
+        try:
+            embedding = await asyncio.to_thread(self._encode, message)
+        except Exception as e:
+            logger.error(f"Ошибка вычисления эмбеддинга: {e}")
+            return None
+        if embedding is not None:
+            self._last_embedding = (message, embedding)
+        return embedding
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def _evict(self, key: str):
+        entry = self._entries.pop(key)
+        if entry.slot is not None:
+            self._matrix[entry.slot] = 0
+            self._slot_keys[entry.slot] = None
+            self._free_slots.append(entry.slot)
+
+    def _hit(self, key: str, entry: _Entry) -> str:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.response
+
+    async def get(self, message: str, history: list) -> Optional[str]:
+        if not self.is_deterministic:
+            return None
+
+        now = time.monotonic()
+        key, context = self._make_key(message, history)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry, now):
+                return self._hit(key, entry)
+            self._evict(key)
+
+        embedding = await self._embed(message)
+        if embedding is not None and self._entries:
+            # Один матрично-векторный проход по всем сохраненным эмбеддингам
+            scores = self._matrix @ embedding
+            for slot in self._np.argsort(scores)[::-1]:
+                if scores[slot] < self.threshold:
+                    break
+                candidate_key = self._slot_keys[slot]
+                if candidate_key is None:
+                    continue
+                candidate = self._entries[candidate_key]
+                if candidate.context == context and not self._expired(candidate, now):
+                    return self._hit(candidate_key, candidate)
+
+        self.misses += 1
+        return None
+
+    async def put(self, message: str, history: list, response: str):
+        if not self.is_deterministic or not response:
+            return
+
+        # Эмбеддинг считается до изменения структур кэша: после await
+        # все правки выполняются без переключения на другие корутины
+        embedding = await self._embed(message)
+        key, context = self._make_key(message, history)
+        if key in self._entries:
+            self._evict(key)
+        while len(self._entries) >= self.maxsize:
+            self._evict(next(iter(self._entries)))
+
+        slot = None
+        if embedding is not None:
+            slot = self._free_slots.pop()
+            self._matrix[slot] = embedding
+            self._slot_keys[slot] = key
+        self._entries[key] = _Entry(response, time.monotonic(), context, slot)